@@ -1,12 +1,35 @@
 import argparse
+import asyncio
 import configparser
+import copy
+import functools
+import ipaddress
+import dns.asyncquery
+import dns.asyncresolver
+import dns.entropy
+import dns.exception
+import dns.flags
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
 import dns.resolver
 import json
 import csv
+import os
+import struct
+import sys
+import threading
+import time
 from termcolor import colored
-from retrying import retry
 import ipinfo
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 banner = r"""
            _              _ 
      /\   | |            (_)
@@ -17,92 +40,337 @@ banner = r"""
                 Kuraiyume
 """
 
-def perform_dns_lookup(domain, record_type, timeout, nameserver=None, ipinfo_token=None):
-    resolver = dns.resolver.Resolver()
-    resolver.timeout = timeout
-    resolver.lifetime = timeout
-    if nameserver:
-        resolver.nameservers = [nameserver]
-    
-    result = []
+_NO_COLOR = not sys.stdout.isatty() or bool(os.environ.get('NO_COLOR'))
+
+def _c(text, color):
+    return text if _NO_COLOR else colored(text, color)
+
+_BASE_RESOLVER = dns.asyncresolver.Resolver()
+
+@functools.lru_cache(maxsize=8)
+def _get_resolver(nameserver=None):
+    if not nameserver:
+        return _BASE_RESOLVER
+    resolver = copy.copy(_BASE_RESOLVER)
+    resolver.nameservers = [nameserver]
+    return resolver
+
+@functools.lru_cache(maxsize=32)
+def _query_template(rdtype):
+    """Header flags/counts and post-QNAME bytes for a query of this type.
+
+    The query wire format is id(2) + flags and counts(10) + QNAME +
+    qtype/qclass(4) + OPT record; everything but the id and QNAME is
+    constant per record type, so serialize it once against the root name
+    (a single zero byte at offset 12) and splice per query.
+    """
+    wire = dns.message.make_query(dns.name.root, rdtype, use_edns=0, payload=1232).to_wire()
+    return wire[2:12], wire[13:]
+
+class _DnsMultiplexer(asyncio.DatagramProtocol):
+    """One UDP socket shared by all in-flight queries, matched by transaction id."""
+
+    def __init__(self):
+        self._transport = None
+        self._pending = {}
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            response = dns.message.from_wire(data)
+        except Exception:
+            return
+        future = self._pending.pop(response.id, None)
+        if future is not None and not future.done():
+            future.set_result(response)
+
+    def error_received(self, exc):
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(exc)
+
+    async def query(self, qname, rdtype, timeout):
+        header, tail = _query_template(rdtype)
+        qid = dns.entropy.random_16()
+        while qid in self._pending:
+            qid = dns.entropy.random_16()
+        future = asyncio.get_running_loop().create_future()
+        self._pending[qid] = future
+        self._transport.sendto(struct.pack('!H', qid) + header + qname.to_wire() + tail)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise dns.exception.Timeout(timeout=timeout)
+        finally:
+            self._pending.pop(qid, None)
+
+_multiplexers = {}
+
+async def _get_multiplexer(address):
+    loop = asyncio.get_running_loop()
+    key = (loop, address)
+    multiplexer = _multiplexers.get(key)
+    if multiplexer is None:
+        _, multiplexer = await loop.create_datagram_endpoint(
+            _DnsMultiplexer, remote_addr=(address, 53))
+        _multiplexers[key] = multiplexer
+    return multiplexer
+
+async def _resolve(resolver, domain, record_type, timeout):
+    qname = domain if isinstance(domain, dns.name.Name) else dns.name.from_text(domain)
+    rdtype = dns.rdatatype.from_text(record_type)
+    server = resolver.nameservers[0]
+    address = getattr(server, 'address', server)
+
+    multiplexer = await _get_multiplexer(address)
+    response = await multiplexer.query(qname, rdtype, timeout)
+    if response.flags & dns.flags.TC:
+        request = dns.message.make_query(qname, rdtype, use_edns=0, payload=1232)
+        response = await dns.asyncquery.tcp(request, address, timeout=timeout)
+
+    rcode = response.rcode()
+    if rcode == dns.rcode.NXDOMAIN:
+        raise dns.resolver.NXDOMAIN(qnames=[qname], responses={qname: response})
+    if rcode == dns.rcode.YXDOMAIN:
+        raise dns.resolver.YXDOMAIN()
+    if rcode != dns.rcode.NOERROR:
+        raise dns.resolver.NoNameservers(
+            request=dns.message.make_query(qname, rdtype),
+            errors=[(address, False, 53, dns.rcode.to_text(rcode), response)])
+
+    answer = dns.resolver.Answer(qname, rdtype, dns.rdataclass.IN, response, address)
+    if answer.rrset is None:
+        raise dns.resolver.NoAnswer(response=response)
+    return answer
+
+_NEG_CACHE_TTL = 60
+_neg_cache = {}
+
+async def perform_dns_lookup(domain, record_type, timeout, nameserver=None, ipinfo_token=None, qname=None):
+    resolver = _get_resolver(nameserver)
+
+    cache_key = (domain, record_type, nameserver)
+    cached = _neg_cache.get(cache_key)
+    if cached:
+        if time.monotonic() < cached[0]:
+            return dict(cached[1])
+        del _neg_cache[cache_key]
+
+    result = {"domain": domain, "type": record_type, "records": [], "geo": None, "error": None}
+    records = result["records"]
+    append = records.append
     try:
-        answers = resolver.resolve(domain, record_type)
-        result.append(f"{colored(record_type, 'blue')} records for {colored(domain, 'green')}:")
+        answers = await _resolve(resolver, qname if qname is not None else domain, record_type, timeout)
         ips = []
         for rdata in answers:
             ip_str = str(rdata)
-            result.append(ip_str)
+            append(ip_str)
             if record_type == "A" and ipinfo_token:
                 ips.append(ip_str)
-        
+
         if ips and ipinfo_token:
-            ip_geolocations = get_ipinfo_data(ips, ipinfo_token)
-            for ip, geo_data in ip_geolocations.items():
-                result.append(f"IP Geolocation for {ip}:")
-                for key, value in geo_data.items():
-                    result.append(f"    {key}: {value}")
+            result["geo"] = await asyncio.to_thread(get_ipinfo_data, ips, ipinfo_token)
     except dns.resolver.NoAnswer:
-        result.append(colored(f"No {record_type} records found for {domain}.", 'yellow'))
+        result["error"] = "no_answer"
+        _neg_cache[cache_key] = (time.monotonic() + _NEG_CACHE_TTL, dict(result))
     except dns.resolver.NXDOMAIN:
-        result.append(colored(f"The domain {domain} does not exist.", 'red'))
-    except dns.resolver.Timeout:
-        result.append(colored(f"Timeout while resolving {domain} for {record_type} records.", 'red'))
+        result["error"] = "nxdomain"
+        _neg_cache[cache_key] = (time.monotonic() + _NEG_CACHE_TTL, dict(result))
+    except dns.exception.Timeout:
+        raise
     except dns.resolver.YXDOMAIN:
-        result.append(colored(f"Too many questions in the DNS query for {domain}.", 'red'))
+        result["error"] = "yxdomain"
     except dns.resolver.NoNameservers:
-        result.append(colored(f"No nameservers available to resolve {domain}.", 'red'))
+        result["error"] = "no_nameservers"
     except Exception as e:
-        result.append(colored(f"An error occurred: {e}", 'red'))
+        result["error"] = "exception"
+        result["detail"] = str(e)
     return result
 
+@functools.lru_cache(maxsize=4)
+def _get_ipinfo_handler(token):
+    return ipinfo.getHandler(token)
+
+_GEO_CACHE_TTL = 600
+_geo_cache = {}
+_geo_cache_lock = threading.Lock()
+
 def get_ipinfo_data(ips, token):
-    handler = ipinfo.getHandler(token)
     geolocations = {}
-    for ip in ips:
-        try:
-            details = handler.getDetails(ip)
+    now = time.monotonic()
+    misses = []
+    with _geo_cache_lock:
+        for ip in ips:
+            try:
+                if not ipaddress.ip_address(ip).is_global:
+                    geolocations[ip] = {
+                        "Note": "Private or reserved address, skipped geolocation lookup."
+                    }
+                    continue
+            except ValueError:
+                pass
+            cached = _geo_cache.get(ip)
+            if cached and now - cached[0] < _GEO_CACHE_TTL:
+                geolocations[ip] = cached[1]
+            else:
+                misses.append(ip)
+    if not misses:
+        return geolocations
+
+    handler = _get_ipinfo_handler(token)
+    try:
+        batch = handler.getBatchDetails(misses, batch_size=1000)
+    except Exception as e:
+        for ip in misses:
             geolocations[ip] = {
-                "City": details.city,
-                "Region": details.region,
-                "Country": details.country,
-                "Org": details.org,
-                "Postal": details.postal,
-                "Timezone": details.timezone,
-                "Location": details.loc
+                "Error": f"Could not retrieve geolocation data: {e}"
             }
-        except Exception as e:
+        return geolocations
+
+    for ip in misses:
+        details = batch.get(ip)
+        if isinstance(details, dict):
             geolocations[ip] = {
-                "Error": f"Could not retrieve geolocation data: {e}"
+                "City": details.get("city"),
+                "Region": details.get("region"),
+                "Country": details.get("country"),
+                "Org": details.get("org"),
+                "Postal": details.get("postal"),
+                "Timezone": details.get("timezone"),
+                "Location": details.get("loc")
+            }
+            with _geo_cache_lock:
+                _geo_cache[ip] = (time.monotonic(), geolocations[ip])
+        else:
+            geolocations[ip] = {
+                "Error": f"Could not retrieve geolocation data for {ip}"
             }
     return geolocations
 
+def _split_csv(value):
+    return [token for token in (part.strip() for part in value.split(',')) if token]
+
 def load_config(config_file):
     config = configparser.ConfigParser()
     config.read(config_file)
-    domains = config.get('settings', 'domains').split(',')
-    record_types = config.get('settings', 'record_types').split(',')
+    domains = _split_csv(config.get('settings', 'domains'))
+    record_types = _split_csv(config.get('settings', 'record_types'))
     timeout = config.getfloat('settings', 'timeout')
     nameserver = config.get('settings', 'nameserver', fallback=None)
     ipinfo_token = config.get('settings', 'ipinfo_token', fallback=None)
     return domains, record_types, timeout, nameserver, ipinfo_token
 
-def save_results(results, output_file, output_format):
-    if output_format == 'json':
-        with open(output_file, 'w') as f:
-            json.dump(results, f, indent=4)
-    elif output_format == 'csv':
-        with open(output_file, 'w', newline='') as f:
-            writer = csv.writer(f)
-            for result in results:
-                writer.writerow([result])
-    else:
-        with open(output_file, 'w') as f:
-            for line in results:
-                f.write(line + '\n')
+def _json_dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value)
+
+class ResultWriter:
+    def __init__(self, output_file=None, output_format='txt'):
+        self.output_format = output_format
+        self._first = True
+        if output_file:
+            self._file = open(output_file, 'w', newline='' if output_format == 'csv' else None)
+            if output_format == 'csv':
+                self._csv = csv.writer(self._file)
+            elif output_format == 'json':
+                self._file.write('[\n')
+        else:
+            self._file = None
 
-@retry(wait_fixed=2000, stop_max_attempt_number=3)
-def perform_dns_lookup_with_retry(domain, record_type, timeout, nameserver=None, ipinfo_token=None):
-    return perform_dns_lookup(domain, record_type, timeout, nameserver, ipinfo_token)
+    def write(self, lines):
+        for line in lines:
+            if self._file is None:
+                print(line)
+            elif self.output_format == 'json':
+                if not self._first:
+                    self._file.write(',\n')
+                self._file.write(_json_dumps(line))
+                self._first = False
+            elif self.output_format == 'csv':
+                self._csv.writerow([line])
+            else:
+                self._file.write(line + '\n')
+
+    def close(self):
+        if self._file is not None:
+            if self.output_format == 'json':
+                self._file.write('\n]\n')
+            self._file.close()
+
+async def perform_dns_lookup_with_retry(domain, record_type, timeout, nameserver=None, ipinfo_token=None, qname=None):
+    for attempt in range(3):
+        try:
+            return await perform_dns_lookup(domain, record_type, timeout, nameserver, ipinfo_token, qname)
+        except dns.exception.Timeout:
+            if attempt == 2:
+                return {"domain": domain, "type": record_type, "records": [], "geo": None, "error": "timeout"}
+            await asyncio.sleep(2 * (attempt + 1))
+
+async def lookup_all_types(domain, record_types, timeout, nameserver=None, ipinfo_token=None):
+    try:
+        qname = dns.name.from_text(domain)
+    except Exception as exc:
+        return [{"domain": domain, "type": record_type, "records": [], "geo": None,
+                 "error": "exception", "detail": str(exc)} for record_type in record_types]
+
+    results = []
+    for record_type in record_types:
+        try:
+            results.append(await perform_dns_lookup_with_retry(domain, record_type, timeout, nameserver, ipinfo_token, qname))
+        except Exception as exc:
+            results.append({"domain": domain, "type": record_type, "records": [], "geo": None,
+                            "error": "exception", "detail": str(exc)})
+    return results
+
+def format_result(result):
+    domain = result["domain"]
+    record_type = result["type"]
+    error = result["error"]
+    if error == "no_answer":
+        return [_c(f"No {record_type} records found for {domain}.", 'yellow')]
+    if error == "nxdomain":
+        return [_c(f"The domain {domain} does not exist.", 'red')]
+    if error == "timeout":
+        return [_c(f"Timeout while resolving {domain} for {record_type} records.", 'red')]
+    if error == "yxdomain":
+        return [_c(f"Too many questions in the DNS query for {domain}.", 'red')]
+    if error == "no_nameservers":
+        return [_c(f"No nameservers available to resolve {domain}.", 'red')]
+    if error == "exception":
+        return [_c(f"An error occurred: {result['detail']}", 'red')]
+
+    lines = [f"{_c(record_type, 'blue')} records for {_c(domain, 'green')}:"]
+    lines.extend(result["records"])
+    if result["geo"]:
+        for ip, geo_data in result["geo"].items():
+            lines.append(f"IP Geolocation for {ip}:")
+            for key, value in geo_data.items():
+                lines.append(f"    {key}: {value}")
+    return lines
+
+async def run_lookups(domains, record_types, timeout, nameserver, ipinfo_token, concurrency, emit):
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def worker():
+        while True:
+            domain = await queue.get()
+            try:
+                emit(await lookup_all_types(domain, record_types, timeout, nameserver, ipinfo_token))
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        for domain in domains:
+            await queue.put(domain)
+        await queue.join()
+    finally:
+        for task in workers:
+            task.cancel()
 
 def main():
     print(banner)
@@ -115,9 +383,14 @@ def main():
     parser.add_argument("-o", "--output", type=str, help="Output file to save the results.")
     parser.add_argument("-f", "--format", type=str, choices=['txt', 'json', 'csv'], default='txt', help="Output format for the results.")
     parser.add_argument("-n", "--nameserver", type=str, help="Custom nameserver for DNS resolution.")
+    parser.add_argument("-th", "--threads", type=int, default=10, help="Concurrency level for DNS queries. Default is 10.")
     parser.add_argument("--ipinfo-token", type=str, help="IPinfo API token for IP geolocation.")
     args = parser.parse_args()
 
+    global _NO_COLOR
+    if args.output:
+        _NO_COLOR = True
+
     if args.config:
         domains, record_types, timeout, nameserver, ipinfo_token = load_config(args.config)
     else:
@@ -129,21 +402,16 @@ def main():
         nameserver = args.nameserver
         ipinfo_token = args.ipinfo_token
 
-    results = []
-    
-    for domain in domains:
-        for record_type in record_types:
-            try:
-                result = perform_dns_lookup_with_retry(domain, record_type, timeout, nameserver, ipinfo_token)
-                results.extend(result)
-            except Exception as exc:
-                results.append(colored(f"{record_type} generated an exception: {exc}", 'red'))
+    writer = ResultWriter(args.output, args.format)
 
-    if args.output:
-        save_results(results, args.output, args.format)
-    else:
-        for line in results:
-            print(line)
+    def emit(results):
+        for result in results:
+            writer.write(format_result(result))
+
+    try:
+        asyncio.run(run_lookups(domains, record_types, timeout, nameserver, ipinfo_token, args.threads * 10, emit))
+    finally:
+        writer.close()
 
 if __name__ == "__main__":
     main()